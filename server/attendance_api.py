@@ -3,15 +3,24 @@
 
 A Flask API that fetches attendance data from SBTET Telangana and provides CORS-enabled endpoints.
 """
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response
 from flask_cors import CORS
 import requests
+import cProfile
+import collections
+import hmac
+import io
 import os
+import pstats
+import sys
+import threading
 import time
 import re
+import uuid
+import zlib
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+CORS(app, expose_headers=["X-Profile-Id"])  # Enable CORS for all routes
 
 DEFAULT_URL_TEMPLATE = "https://www.sbtet.telangana.gov.in/api/api/PreExamination/getAttendanceReport?Pin={pin}"
 
@@ -25,11 +34,54 @@ RESULTS_JSON_URL_TEMPLATE = "https://www.sbtet.telangana.gov.in/api/api/Results/
 # { pin_lower: (timestamp, html_text) }
 _RESULTS_CACHE = {}
 _RESULTS_CACHE_TTL_SECONDS = 5 * 60
+_RESULTS_STREAM_CHUNK_SIZE = 16 * 1024
 
 # { pin_lower: (timestamp, json_dict) }
 _RESULTS_JSON_CACHE = {}
 _RESULTS_JSON_CACHE_TTL_SECONDS = 5 * 60
 
+# Opt-in profiling. Everything below is inert unless PROFILING_ADMIN_TOKEN is set.
+PROFILING_ADMIN_TOKEN = os.environ.get("PROFILING_ADMIN_TOKEN", "")
+_PROFILE_SAMPLE_INTERVAL_SECONDS = 0.005
+_PROFILE_RING_SIZE = 20
+_PROFILE_MAX_STACK_DEPTH = 128
+
+
+def _profiling_env(name: str, default, cast):
+    """Read a positive numeric profiling setting, falling back to the default on bad input."""
+    raw = os.environ.get(name)
+    if raw is None:
+        return default
+    try:
+        value = cast(raw)
+        if value > 0:
+            return value
+    except ValueError:
+        pass
+    print(f"WARNING - Ignoring invalid {name}={raw!r}; using {default}")
+    return default
+
+
+if PROFILING_ADMIN_TOKEN:
+    _PROFILE_SAMPLE_INTERVAL_SECONDS = _profiling_env(
+        "PROFILING_SAMPLE_INTERVAL", _PROFILE_SAMPLE_INTERVAL_SECONDS, float
+    )
+    _PROFILE_RING_SIZE = _profiling_env("PROFILING_RING_SIZE", _PROFILE_RING_SIZE, int)
+
+# Bounded ring of captured profiles, newest last.
+_PROFILES = collections.deque(maxlen=_PROFILE_RING_SIZE)
+_PROFILES_LOCK = threading.Lock()
+
+# Since Python 3.12 cProfile hooks every thread in the process rather than the
+# one that enabled it, and only one can be active at a time. Profiled requests
+# then take turns holding this lock; the rest fall back to stack sampling only.
+_CPROFILE_IS_PROCESS_WIDE = sys.version_info >= (3, 12)
+_CPROFILE_LOCK = threading.Lock()
+
+# Process-wide sampler toggled from the admin endpoint (None when stopped).
+_GLOBAL_SAMPLER = None
+_GLOBAL_SAMPLER_LOCK = threading.Lock()
+
 
 def fetch_report_pin(pin: str):
     """Fetch attendance report from SBTET API"""
@@ -250,28 +302,16 @@ def get_results_json():
         return jsonify({"success": False, "error": f"Server error: {str(e)}"}), 500
 
 
-def fetch_results_html(pin: str) -> str:
-    pin_key = (pin or "").strip().lower()
-    if not pin_key:
-        raise ValueError("Missing pin")
-
-    now = time.time()
+def _cached_results_html(pin_key: str, now: float):
     cached = _RESULTS_CACHE.get(pin_key)
     if cached:
         cached_at, cached_html = cached
         if now - cached_at < _RESULTS_CACHE_TTL_SECONDS:
             return cached_html
+    return None
 
-    url = RESULTS_URL_TEMPLATE.format(pin=pin_key)
-    resp = requests.get(url, headers=_results_headers(), timeout=20)
-    if resp.status_code == 404:
-        raise requests.exceptions.HTTPError("Student not found", response=resp)
-    resp.raise_for_status()
-
-    html = resp.text or ""
-    if len(html) < 200:
-        raise requests.exceptions.RequestException("Upstream returned empty HTML")
 
+def _store_results_html(pin_key: str, now: float, html: str):
     _RESULTS_CACHE[pin_key] = (now, html)
     # opportunistic cache cleanup
     if len(_RESULTS_CACHE) > 200:
@@ -279,20 +319,147 @@ def fetch_results_html(pin: str) -> str:
             if now - ts > _RESULTS_CACHE_TTL_SECONDS:
                 _RESULTS_CACHE.pop(k, None)
 
+
+def _get_results_page(pin_key: str, stream: bool = False):
+    url = RESULTS_URL_TEMPLATE.format(pin=pin_key)
+    resp = requests.get(url, headers=_results_headers(), timeout=20, stream=stream)
+    if resp.status_code == 404:
+        resp.close()
+        raise requests.exceptions.HTTPError("Student not found", response=resp)
+    try:
+        resp.raise_for_status()
+    except requests.exceptions.HTTPError:
+        resp.close()
+        raise
+    return resp
+
+
+def fetch_results_html(pin: str) -> str:
+    pin_key = (pin or "").strip().lower()
+    if not pin_key:
+        raise ValueError("Missing pin")
+
+    now = time.time()
+    cached_html = _cached_results_html(pin_key, now)
+    if cached_html is not None:
+        return cached_html
+
+    resp = _get_results_page(pin_key)
+
+    html = resp.text or ""
+    if len(html) < 200:
+        raise requests.exceptions.RequestException("Upstream returned empty HTML")
+
+    _store_results_html(pin_key, now, html)
     return html
 
 
+def _decode_results_body(resp, body: bytes) -> str:
+    """Decode a streamed body the same way resp.text would have.
+
+    resp.apparent_encoding can't be used here since it reads resp.content,
+    which a streamed response has already handed out chunk by chunk.
+    """
+    encoding = resp.encoding
+    if encoding is None and requests.compat.chardet is not None:
+        encoding = requests.compat.chardet.detect(body)["encoding"]
+    try:
+        return str(body, encoding or "utf-8", errors="replace")
+    except LookupError:
+        return str(body, errors="replace")
+
+
+def stream_results_html(pin: str):
+    """Stream the results HTML page as it arrives from upstream.
+
+    Returns (chunks, content_type). Upstream errors and the empty-page check
+    are raised before the first byte is handed back, so callers can still
+    answer with a JSON error. The body is teed into the results cache once
+    the upstream response completes.
+    """
+    pin_key = (pin or "").strip().lower()
+    if not pin_key:
+        raise ValueError("Missing pin")
+
+    now = time.time()
+    cached_html = _cached_results_html(pin_key, now)
+    if cached_html is not None:
+        return iter([cached_html.encode("utf-8")]), "text/html; charset=utf-8"
+
+    resp = _get_results_page(pin_key, stream=True)
+    upstream = resp.iter_content(chunk_size=_RESULTS_STREAM_CHUNK_SIZE)
+
+    # Hold back just enough of the body to apply the same sanity check as
+    # fetch_results_html before committing to a 200 response.
+    head = []
+    head_len = 0
+    try:
+        for chunk in upstream:
+            head.append(chunk)
+            head_len += len(chunk)
+            if head_len >= 200:
+                break
+    except Exception:
+        resp.close()
+        raise
+    if head_len < 200:
+        resp.close()
+        raise requests.exceptions.RequestException("Upstream returned empty HTML")
+
+    # Without a Content-Type we can't know the charset before the body has
+    # arrived, so leave it to the client, as resp.text does for the JSON path.
+    content_type = resp.headers.get("Content-Type") or "text/html"
+
+    def generate():
+        body = list(head)
+        try:
+            yield from head
+            for chunk in upstream:
+                body.append(chunk)
+                yield chunk
+        finally:
+            resp.close()
+        # Only reached when the upstream body was fully forwarded.
+        _store_results_html(pin_key, now, _decode_results_body(resp, b"".join(body)))
+
+    return generate(), content_type
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        # Sync-flush so each upstream chunk reaches the client without waiting for more input.
+        data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 @app.route("/api/results/raw", methods=["GET"])
 def get_results_raw():
     """Proxy the results HTML page by PIN.
 
-    Frontend parses the HTML into structured analytics.
+    Frontend parses the HTML into structured analytics. By default the page
+    is wrapped in JSON ({"success", "pin", "html"}); pass `stream=1` to get
+    the HTML itself forwarded chunk by chunk, gzip-compressed when the client
+    accepts it (`compress=0` disables that).
     """
     pin = request.args.get("pin")
     if not pin:
         return jsonify({"success": False, "error": "Missing pin parameter"}), 400
 
     try:
+        if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+            chunks, content_type = stream_results_html(pin)
+            headers = {"Cache-Control": "no-store", "Vary": "Accept-Encoding"}
+            compress = request.args.get("compress", "1").lower() not in ("0", "false", "no")
+            # Membership ignores q-values; "gzip;q=0" means the client refuses gzip.
+            if compress and request.accept_encodings["gzip"] > 0:
+                chunks = _gzip_chunks(chunks)
+                headers["Content-Encoding"] = "gzip"
+            return Response(chunks, status=200, content_type=content_type, headers=headers)
+
         html = fetch_results_html(pin)
         return jsonify({"success": True, "pin": pin, "html": html}), 200
     except requests.exceptions.HTTPError as e:
@@ -420,6 +587,243 @@ def health():
     return jsonify({"status": "ok", "service": "SBTET Attendance API"}), 200
 
 
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _StackSampler:
+    """Background thread that periodically samples Python stacks.
+
+    Samples are aggregated as collapsed stacks ("root;child;leaf count"), the
+    input format of flamegraph.pl / speedscope. If thread_id is given only that
+    thread is sampled, otherwise every thread except the sampler itself.
+    """
+
+    def __init__(self, thread_id=None, interval=_PROFILE_SAMPLE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self.samples = 0
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                frame = frames.get(self.thread_id)
+                items = [(self.thread_id, frame)] if frame is not None else []
+            else:
+                items = [(tid, f) for tid, f in frames.items() if tid != own_id]
+            for _, frame in items:
+                stack = []
+                while frame is not None and len(stack) < _PROFILE_MAX_STACK_DEPTH:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.counts.most_common())
+
+
+def _new_profile_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def _store_profile(kind: str, started_at: float, profile_id=None, **fields):
+    entry = {
+        "id": profile_id or _new_profile_id(),
+        "kind": kind,
+        "startedAt": started_at,
+        "durationMs": round((time.time() - started_at) * 1000.0, 2),
+        **fields,
+    }
+    with _PROFILES_LOCK:
+        _PROFILES.append(entry)
+    return entry
+
+
+def _profile_summary(entry: dict):
+    return {k: v for k, v in entry.items() if k not in ("collapsed", "pstats")}
+
+
+def _is_profiling_admin() -> bool:
+    if not PROFILING_ADMIN_TOKEN:
+        return False
+    token = request.headers.get("X-Admin-Token", "")
+    return hmac.compare_digest(token.encode(), PROFILING_ADMIN_TOKEN.encode())
+
+
+@app.before_request
+def _start_request_profile():
+    """Profile this request when an admin sends `X-Profile-Request: 1`."""
+    if not PROFILING_ADMIN_TOKEN:
+        return
+    if request.headers.get("X-Profile-Request", "").lower() not in ("1", "true", "yes"):
+        return
+    if not _is_profiling_admin():
+        return
+
+    profiler = None
+    pstats_skipped = None
+    if _CPROFILE_IS_PROCESS_WIDE and not _CPROFILE_LOCK.acquire(blocking=False):
+        pstats_skipped = "another request was already being cProfiled"
+    else:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as exc:
+            # Some other tool (a debugger, coverage, sys.setprofile) already holds the profiling hook.
+            profiler = None
+            pstats_skipped = str(exc)
+            if _CPROFILE_IS_PROCESS_WIDE:
+                _CPROFILE_LOCK.release()
+    # Request details are captured now: the profile may be finished after the
+    # request context is gone, once a streamed body has been sent.
+    g.profile_state = {
+        "id": _new_profile_id(),
+        "startedAt": time.time(),
+        "method": request.method,
+        "path": request.full_path.rstrip("?"),
+        "profiler": profiler,
+        "pstatsSkipped": pstats_skipped,
+        "sampler": _StackSampler(thread_id=threading.get_ident()).start(),
+    }
+
+
+def _stop_request_profile(state: dict, status_code=None):
+    profiler, sampler = state["profiler"], state["sampler"]
+    pstats_text = ""
+    if profiler is not None:
+        profiler.disable()
+        if _CPROFILE_IS_PROCESS_WIDE:
+            _CPROFILE_LOCK.release()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(60)
+        pstats_text = out.getvalue()
+    sampler.stop()
+    return _store_profile(
+        "request",
+        state["startedAt"],
+        profile_id=state["id"],
+        method=state["method"],
+        path=state["path"],
+        status=status_code,
+        samples=sampler.samples,
+        collapsed=sampler.collapsed(),
+        pstats=pstats_text,
+        pstatsSkipped=state["pstatsSkipped"],
+    )
+
+
+@app.after_request
+def _finish_request_profile(response):
+    if not PROFILING_ADMIN_TOKEN:
+        return response
+    state = g.pop("profile_state", None)
+    if state is None:
+        return response
+    response.headers["X-Profile-Id"] = state["id"]
+    # after_request runs before the body is iterated, so a streamed response
+    # (/api/results/raw?stream=1) is only finished once the server closes it.
+    status_code = response.status_code
+    response.call_on_close(lambda: _stop_request_profile(state, status_code))
+    return response
+
+
+@app.teardown_request
+def _teardown_request_profile(exc):
+    # after_request is skipped when a request dies mid-flight; never leak a sampler.
+    if PROFILING_ADMIN_TOKEN:
+        state = g.pop("profile_state", None)
+        if state is not None:
+            _stop_request_profile(state)
+
+
+@app.route("/api/admin/profiling", methods=["GET", "POST"])
+def profiling_control():
+    """Show profiler status, or start/stop the process-wide sampler.
+
+    POST body: {"action": "start" | "stop"}. Stopping stores the capture in the ring.
+    """
+    global _GLOBAL_SAMPLER
+    if not _is_profiling_admin():
+        return jsonify({"success": False, "error": "Not found"}), 404
+
+    if request.method == "POST":
+        body = request.get_json(silent=True)
+        action = (body.get("action") if isinstance(body, dict) else None) or request.args.get("action")
+        with _GLOBAL_SAMPLER_LOCK:
+            if action == "start":
+                if _GLOBAL_SAMPLER is None:
+                    _GLOBAL_SAMPLER = _StackSampler().start()
+            elif action == "stop":
+                if _GLOBAL_SAMPLER is None:
+                    return jsonify({"success": False, "error": "Sampler is not running"}), 409
+                sampler, _GLOBAL_SAMPLER = _GLOBAL_SAMPLER.stop(), None
+                entry = _store_profile(
+                    "sampler",
+                    sampler.started_at,
+                    samples=sampler.samples,
+                    collapsed=sampler.collapsed(),
+                    pstats="",
+                )
+                return jsonify({"success": True, "profile": _profile_summary(entry)}), 200
+            else:
+                return jsonify({"success": False, "error": "action must be 'start' or 'stop'"}), 400
+
+    with _PROFILES_LOCK:
+        profiles = [_profile_summary(p) for p in _PROFILES]
+    return jsonify({
+        "success": True,
+        "samplerRunning": _GLOBAL_SAMPLER is not None,
+        "sampleIntervalSeconds": _PROFILE_SAMPLE_INTERVAL_SECONDS,
+        "ringSize": _PROFILES.maxlen,
+        "profiles": profiles,
+    }), 200
+
+
+@app.route("/api/admin/profiles/<profile_id>", methods=["GET"])
+def download_profile(profile_id):
+    """Download a captured profile.
+
+    `format=collapsed` (default) is flame-graph ready, `format=pstats` is the
+    cProfile report (per-request profiles only), `format=json` is everything.
+    """
+    if not _is_profiling_admin():
+        return jsonify({"success": False, "error": "Not found"}), 404
+
+    with _PROFILES_LOCK:
+        entry = next((p for p in _PROFILES if p["id"] == profile_id), None)
+    if entry is None:
+        return jsonify({"success": False, "error": "Profile not found"}), 404
+
+    fmt = request.args.get("format", "collapsed")
+    if fmt == "json":
+        return jsonify({"success": True, "profile": entry}), 200
+    if fmt not in ("collapsed", "pstats"):
+        return jsonify({"success": False, "error": "format must be collapsed, pstats or json"}), 400
+    return Response(
+        entry[fmt],
+        mimetype="text/plain",
+        headers={"Content-Disposition": f"attachment; filename=profile-{profile_id}.{fmt}.txt"},
+    )
+
+
 # Serve React frontend (for Azure deployment)
 from flask import send_from_directory
 